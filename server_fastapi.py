@@ -3,29 +3,46 @@
 
 Endpoints:
 - POST /upload_bib -> multipart upload of a .bib file, saved to ./data/
-- POST /run_wordcloud -> runs wordcloud_minimal.py and returns stdout/stderr and output paths
+- POST /run_wordcloud -> runs the wordcloud_minimal pipeline and returns stdout/stderr and output paths
 
 Static files are mounted at /static so the UI can fetch images at /static/outputs/...
 """
 from __future__ import annotations
 import sys
 import os
+import io
+import csv
 import time
 import shutil
-import subprocess
+import asyncio
+import contextlib
+import importlib
+import itertools
+import traceback
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
+import wordcloud_minimal
+
 # Windows event loop policy (helps with uvicorn on Windows)
 if sys.platform == 'win32':
     try:
-        import asyncio
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     except Exception:
         pass
+else:
+    # uvloop is a faster drop-in event loop; keep the default one if it is missing
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
 
 BASE = Path(__file__).parent
 DATA_DIR = BASE / 'data'
@@ -33,7 +50,95 @@ OUT_DIR = BASE / 'outputs'
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-app = FastAPI(title='Requerimiento5 helper')
+# Uploads are copied to disk in chunks of this size, and rejected above MAX_UPLOAD_BYTES.
+UPLOAD_CHUNK_SIZE = 1 << 20
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(100 * 1024 * 1024)))
+
+
+# Shared with the pool workers: id of the job a worker is executing (0 = idle).
+# Lets a timed-out request tell its own run apart from another client's.
+_running_job = None
+_job_ids = itertools.count(1)
+
+
+def _preimport(running_job) -> None:
+    """Worker initializer: import the heavy rendering libraries once per process."""
+    global _running_job
+    _running_job = running_job
+    for name in ('wordcloud', 'PIL.Image', 'polars', 'pandas', 'bibtexparser'):
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def _new_pool() -> ProcessPoolExecutor:
+    # One worker: generate() runs under an exclusive lock, so more workers would
+    # only wait on it while each holds ~100 MiB of imported libraries.
+    # spawn: the server process runs threads, which fork does not handle safely
+    global _running_job
+    ctx = multiprocessing.get_context('spawn')
+    if _running_job is None:
+        _running_job = ctx.RawValue('q', 0)
+    pool = ProcessPoolExecutor(max_workers=1, initializer=_preimport, initargs=(_running_job,),
+                               mp_context=ctx)
+    # workers start lazily; a no-op starts it now so the imports are warm for the first run
+    pool.submit(os.getpid)
+    return pool
+
+
+def _kill_pool(pool: ProcessPoolExecutor) -> None:
+    """Terminate the pool's worker processes (a stuck run included) and shut it down.
+
+    Killing the worker also releases the generation lock it may be holding.
+    """
+    if hasattr(pool, 'terminate_workers'):
+        # Python 3.14+
+        pool.terminate_workers()
+        return
+    for proc in list((getattr(pool, '_processes', None) or {}).values()):
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _replace_pool(pool: ProcessPoolExecutor) -> None:
+    # only if no concurrent request has already swapped in a fresh pool
+    if getattr(app.state, 'pool', None) is pool:
+        app.state.pool = _new_pool()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Wordcloud runs go to a long-lived worker process: no interpreter start-up
+    # or library imports per request, and the ASGI worker stays isolated from
+    # the memory used by the rendering libraries.
+    app.state.pool = _new_pool()
+    try:
+        yield
+    finally:
+        app.state.pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title='Requerimiento5 helper', lifespan=lifespan)
+
+UPLOAD_PATHS = {'/upload_bib', '/upload_data', '/api/upload_bib', '/api/upload_data'}
+
+
+@app.middleware('http')
+async def limit_upload_size(request: Request, call_next):
+    """Reject uploads whose declared Content-Length exceeds MAX_UPLOAD_BYTES.
+
+    Runs before FastAPI parses (and spools) the multipart body, so an oversized
+    upload is refused without being read. Bodies without a Content-Length are
+    still capped while `_save_upload` copies them. Registered before CORS so
+    the 413 still carries the CORS headers.
+    """
+    if request.method == 'POST' and request.url.path in UPLOAD_PATHS:
+        length = request.headers.get('content-length')
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+            return JSONResponse({'detail': f'Upload too large (max {MAX_UPLOAD_BYTES} bytes)'}, status_code=413)
+    return await call_next(request)
+
 
 # CORS: during development allow all origins. For production, restrict this
 # to your frontend domain(s), e.g. ['https://mi-frontend.vercel.app']
@@ -55,8 +160,32 @@ app.add_middleware(
 # mount the folder so index.html + outputs are reachable under /static
 app.mount('/static', StaticFiles(directory=str(BASE)), name='static')
 
+# Routes served both at the root and under /api (see the include_router calls at the bottom)
+router = APIRouter()
+
 
-@app.post('/upload_bib')
+async def _save_upload(file: UploadFile, dest: Path) -> None:
+    """Stream an uploaded file to `dest` chunk by chunk instead of reading it whole.
+
+    Data goes to a temporary `.part` file that replaces `dest` only once the
+    upload is complete. Raises 413 if more than MAX_UPLOAD_BYTES arrive.
+    """
+    tmp = dest.with_name(dest.name + '.part')
+    written = 0
+    try:
+        with tmp.open('wb') as fh:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f'Upload too large (max {MAX_UPLOAD_BYTES} bytes)')
+                await asyncio.to_thread(fh.write, chunk)
+        tmp.replace(dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+@router.post('/upload_bib')
 async def upload_bib(file: UploadFile = File(...)):
     """Receive a .bib file and save it into `data/`.
 
@@ -73,9 +202,9 @@ async def upload_bib(file: UploadFile = File(...)):
         dest = DATA_DIR / f"{dest.stem}_{ts}.bib"
 
     try:
-        content = await file.read()
-        with dest.open('wb') as fh:
-            fh.write(content)
+        await _save_upload(file, dest)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Could not save file: {e}')
 
@@ -83,7 +212,7 @@ async def upload_bib(file: UploadFile = File(...)):
     return JSONResponse({'saved_path': f'/static/data/{dest.name}', 'filename': dest.name})
 
 
-@app.post('/upload_data')
+@router.post('/upload_data')
 async def upload_data(file: UploadFile = File(...)):
     """Upload a data file (records.csv or frequencies.json) into the server `data/` folder.
 
@@ -101,54 +230,137 @@ async def upload_data(file: UploadFile = File(...)):
 
     dest = DATA_DIR / safe_name
     try:
-        content = await file.read()
-        with dest.open('wb') as fh:
-            fh.write(content)
+        await _save_upload(file, dest)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Could not save file: {e}')
 
     return JSONResponse({'saved_path': f'/static/data/{dest.name}', 'filename': dest.name})
 
 
-@app.post('/run_wordcloud')
-async def run_wordcloud(timeout: int = 300):
-    """Run the local `wordcloud_minimal.py` script and return its stdout/stderr and output locations.
+def _generate(data_dir: Path, out_dir: Path, job_id: int = 0, deadline: float | None = None) -> tuple[int, str, str]:
+    """Run the wordcloud pipeline in a pool worker, capturing what it prints.
 
-    This runs as a blocking subprocess call to keep the implementation simple.
+    Returns (returncode, stdout, stderr) so the response keeps the same shape
+    it had when the script was launched as a subprocess. A job that only
+    reaches the worker after its request's deadline (time.time()) is skipped.
     """
-    script = BASE / 'wordcloud_minimal.py'
-    if not script.exists():
-        raise HTTPException(status_code=500, detail='wordcloud_minimal.py not found in server folder')
+    if deadline is not None and time.time() > deadline:
+        return 1, '', 'Skipped: the request timed out before the run started\n'
+    if _running_job is not None:
+        _running_job.value = job_id
+    out, err = io.StringIO(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            try:
+                returncode = wordcloud_minimal.generate(data_dir, out_dir)
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        if _running_job is not None:
+            _running_job.value = 0
+    return returncode, out.getvalue(), err.getvalue()
+
+
+async def _run_in_pool(timeout: int) -> tuple[int, str, str]:
+    """Submit a run to the shared pool and wait for it for at most `timeout` seconds.
+
+    On timeout, a job that has not started is just cancelled. The worker is
+    killed (releasing the generation lock) only when it is executing this
+    request's own job, never another client's. Jobs lost because another
+    request replaced the pool are resubmitted to the new one.
+    """
+    job_id = next(_job_ids)
+    deadline = time.time() + timeout
+    while True:
+        pool = getattr(app.state, 'pool', None)
+        if pool is None:
+            # lifespan did not run (e.g. a TestClient used without `with`)
+            pool = app.state.pool = _new_pool()
+        cfut = pool.submit(_generate, DATA_DIR, OUT_DIR, job_id, deadline)
+        afut = asyncio.wrap_future(cfut)
+        try:
+            # shield: decide below whether cancelling the job is safe
+            return await asyncio.wait_for(asyncio.shield(afut), timeout=max(0.0, deadline - time.time()))
+        except asyncio.TimeoutError:
+            started = not cfut.cancel()
+            afut.cancel()  # drop whatever the job still ends with
+            if started and _running_job.value == job_id:
+                _kill_pool(pool)
+                _running_job.value = 0
+                _replace_pool(pool)
+            raise HTTPException(status_code=504, detail=f'Wordcloud generation timed out after {timeout} seconds')
+        except (BrokenProcessPool, CancelledError, asyncio.CancelledError) as e:
+            if isinstance(e, asyncio.CancelledError) and not cfut.cancelled():
+                # this request itself was cancelled, not its job
+                raise
+            if app.state.pool is not pool and time.time() < deadline:
+                # another request killed its stuck run and replaced the pool
+                continue
+            # a worker died (e.g. killed for memory); replace the pool for the next call
+            _replace_pool(pool)
+            raise HTTPException(status_code=500, detail=f'Wordcloud worker crashed: {e!r}')
+
+
+@router.post('/run_wordcloud')
+async def run_wordcloud(timeout: int = 300):
+    """Run the wordcloud pipeline and return its stdout/stderr and output locations.
 
-    cmd = [sys.executable, str(script), '--data-dir', str(DATA_DIR), '--out-dir', str(OUT_DIR)]
+    The work runs in the app's persistent process pool so the event loop keeps
+    serving other requests meanwhile (see `_run_in_pool` for timeouts).
+    """
     try:
-        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-    except subprocess.TimeoutExpired as e:
-        raise HTTPException(status_code=504, detail=f'Wordcloud generation timed out: {e}')
+        returncode, stdout, stderr = await _run_in_pool(timeout)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Error running script: {e}')
+        raise HTTPException(status_code=500, detail=f'Error running wordcloud generation: {e}')
 
     png_rel = f'/static/outputs/nube_palabras.png'
     pdf_rel = f'/static/outputs/nube_palabras.pdf'
     result = {
-        'ok': proc.returncode == 0,
-        'returncode': proc.returncode,
-        'stdout': proc.stdout,
-        'stderr': proc.stderr,
+        'ok': returncode == 0,
+        'returncode': returncode,
+        'stdout': stdout,
+        'stderr': stderr,
         'png_url': png_rel if (OUT_DIR / 'nube_palabras.png').exists() else None,
         'pdf_url': pdf_rel if (OUT_DIR / 'nube_palabras.pdf').exists() else None,
     }
     return JSONResponse(result)
 
 
-@app.get('/status')
+@router.get('/status')
 async def status():
     return {'status': 'ok', 'data_dir': f'/static/data', 'outputs_dir': f'/static/outputs'}
 
 
 
+def _file_response(request: Request, file_path: Path, media_type: str, filename: str) -> Response:
+    """Serve `file_path` with an ETag built from its mtime and size.
+
+    Answers 304 Not Modified when the client already holds the same version,
+    so polling clients do not download an unchanged file again. Range and
+    If-Range requests (206 partial content, resumable downloads) are handled
+    by Starlette's FileResponse; the ETag is a strong one so If-Range can
+    match it.
+    """
+    st = file_path.stat()
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    # no-cache: the URL is fixed, so clients must revalidate (cheaply, via the ETag) on every poll
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('if-none-match', '')
+    # If-None-Match uses weak comparison: ignore a W/ prefix on the client's tags
+    client_tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    if etag in client_tags or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=str(file_path), media_type=media_type, filename=filename, headers=headers,
+                        stat_result=st)
+
+
 @app.get('/api/image')
-async def get_latest_image():
+async def get_latest_image(request: Request):
     """Return the latest generated PNG image (nube_palabras.png) from outputs/.
 
     Returns 404 if the file does not exist.
@@ -156,11 +368,11 @@ async def get_latest_image():
     img = OUT_DIR / 'nube_palabras.png'
     if not img.exists():
         raise HTTPException(status_code=404, detail='Image not found')
-    return FileResponse(path=str(img), media_type='image/png', filename=img.name)
+    return _file_response(request, img, 'image/png', img.name)
 
 
 @app.get('/api/outputs/{filename}')
-async def get_output_file(filename: str):
+async def get_output_file(filename: str, request: Request):
     """Serve a file from the outputs directory safely (prevents path traversal).
 
     Example: /api/outputs/nube_palabras.png
@@ -175,7 +387,49 @@ async def get_output_file(filename: str):
         media_type = mimetypes.guess_type(str(file_path))[0] or 'application/octet-stream'
     except Exception:
         media_type = 'application/octet-stream'
-    return FileResponse(path=str(file_path), media_type=media_type, filename=safe_name)
+    return _file_response(request, file_path, media_type, safe_name)
+
+
+def _count_csv_rows(path: Path) -> int:
+    """Count the data rows of a CSV file (header excluded), like csv.reader does.
+
+    Plain files (no quotes, no bare `\r` line endings) are counted by scanning
+    raw bytes for newlines. Anything else goes through csv.reader, since quoted
+    fields may hold newlines and stray quotes are kept as data.
+    """
+    with path.open('rb') as fh:
+        lines = 0
+        last = b''
+        buf = fh.read(1 << 20)
+        while buf:
+            if buf.endswith(b'\r'):
+                buf += fh.read(1)  # keep a \r\n pair in one chunk
+            if b'"' in buf or buf.count(b'\r') != buf.count(b'\r\n'):
+                break
+            lines += buf.count(b'\n')
+            last = buf[-1:]
+            buf = fh.read(1 << 20)
+        else:
+            if last and last != b'\n':
+                lines += 1
+            return max(0, lines - 1)
+    with path.open('r', encoding='utf-8', errors='ignore', newline='') as fh:
+        return max(0, sum(1 for _ in csv.reader(fh)) - 1)
+
+
+# source -> (stat key, total). A changed mtime/size means a different key,
+# so uploads and merges invalidate the entry without explicit bookkeeping.
+_total_cache: dict[str, tuple[tuple, int]] = {}
+
+
+def _cached_total(source: str, key: tuple, compute) -> int:
+    """Return the cached total for `source` if `key` still matches, else recompute it."""
+    cached = _total_cache.get(source)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    total = compute()
+    _total_cache[source] = (key, total)
+    return total
 
 
 @app.get('/api/records_total')
@@ -190,28 +444,30 @@ async def records_total():
     records_path = DATA_DIR / 'records.csv'
     if records_path.exists():
         try:
-            import csv
-            with records_path.open('r', encoding='utf-8', errors='ignore') as fh:
-                reader = csv.reader(fh)
-                # subtract header if present
-                total = sum(1 for _ in reader)
-                if total > 0:
-                    total = max(0, total - 1)
+            st = records_path.stat()
+            key = (str(records_path), st.st_mtime_ns, st.st_size)
+            total = _cached_total('records.csv', key, lambda: _count_csv_rows(records_path))
             return JSONResponse({'total_records': total, 'source': 'records.csv'})
         except Exception as e:
             raise HTTPException(status_code=500, detail=f'Error reading records.csv: {e}')
 
     # Fallback: count entries in .bib files if bibtexparser available
-    bib_count = 0
     try:
         import bibtexparser
-        for bibf in DATA_DIR.glob('*.bib'):
-            try:
-                text = bibf.read_text(encoding='utf-8', errors='ignore')
-                db = bibtexparser.loads(text)
-                bib_count += len(db.entries)
-            except Exception:
-                continue
+        bib_files = sorted(DATA_DIR.glob('*.bib'))
+
+        def count_bib_entries():
+            bib_count = 0
+            for bibf in bib_files:
+                try:
+                    text = bibf.read_text(encoding='utf-8', errors='ignore')
+                    bib_count += len(wordcloud_minimal.load_bib_entries(text))
+                except Exception:
+                    continue
+            return bib_count
+
+        key = tuple((str(f), st.st_mtime_ns, st.st_size) for f, st in ((f, f.stat()) for f in bib_files))
+        bib_count = _cached_total('bib_files', key, count_bib_entries)
         if bib_count > 0:
             return JSONResponse({'total_records': bib_count, 'source': 'bib_files'})
     except Exception:
@@ -224,6 +480,13 @@ async def records_total():
 # Also expose the same endpoints under the /api prefix so the frontend
 # that was configured for Vercel (/api/upload_bib) works against this
 # local FastAPI server without editing `index.html`.
-app.post('/api/upload_bib')(upload_bib)
-app.post('/api/run_wordcloud')(run_wordcloud)
-app.get('/api/status')(status)
+app.include_router(router)
+app.include_router(router, prefix='/api')
+
+
+if __name__ == '__main__':
+    # `python server_fastapi.py` runs several worker processes (WEB_CONCURRENCY,
+    # default 2). loop/http 'auto' pick uvloop and httptools when installed.
+    import uvicorn
+    uvicorn.run('server_fastapi:app', host='0.0.0.0', port=int(os.environ.get('PORT', '8000')),
+                workers=int(os.environ.get('WEB_CONCURRENCY', '2')), loop='auto', http='auto')
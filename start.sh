@@ -1,4 +1,6 @@
 #!/usr/bin/env sh
 # Start script that uses $PORT if provided (Render sets $PORT automatically)
 PORT=${PORT:-8000}
-exec uvicorn server_fastapi:app --host 0.0.0.0 --port "$PORT"
+# WEB_CONCURRENCY sets the number of uvicorn worker processes
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-2}
+exec uvicorn server_fastapi:app --host 0.0.0.0 --port "$PORT" --workers "$WEB_CONCURRENCY"
@@ -0,0 +1,37 @@
+"""_count_csv_rows must agree with csv.reader (header excluded)."""
+import csv
+
+import pytest
+
+pytest.importorskip('fastapi')
+
+import server_fastapi as sf
+
+
+@pytest.mark.parametrize('content', [
+    b'id,title\n1,a\n2,b\n',
+    b'id,title\n1,a\n2,b',
+    b'id,title\r\n1,a\r\n2,b\r\n',
+    b'id,title\r1,a\r2,b\r',
+    b'id,title\n1,5" display\n2,foo\n3,bar\n',
+    b'id,title\n1,"multi\nline"\n2,"say ""hi"""\n',
+    b'id,title\n1,"a\r\nb"\r\n2,c\r\n',
+    b'id,title\n\n1,a\n',
+    b'id,title\n',
+    b'',
+])
+def test_count_csv_rows_matches_csv_reader(tmp_path, content):
+    path = tmp_path / 'records.csv'
+    path.write_bytes(content)
+    with path.open('r', encoding='utf-8', errors='ignore', newline='') as fh:
+        expected = max(0, sum(1 for _ in csv.reader(fh)) - 1)
+    assert sf._count_csv_rows(path) == expected
+
+
+def test_count_csv_rows_on_records():
+    path = sf.DATA_DIR / 'records.csv'
+    if not path.exists():
+        pytest.skip('no data/records.csv')
+    with path.open('r', encoding='utf-8', errors='ignore', newline='') as fh:
+        expected = max(0, sum(1 for _ in csv.reader(fh)) - 1)
+    assert sf._count_csv_rows(path) == expected
@@ -0,0 +1,74 @@
+"""Every tokenizer branch must count exactly what WORD_RE + the stopword/isdigit() filter counts."""
+import csv
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+import wordcloud_minimal as wm
+
+RECORDS = Path(__file__).resolve().parent.parent / 'data' / 'records.csv'
+BRANCHES = ['polars', 'pandas', 'csv']
+
+
+def old_tokens(text):
+    return [w for w in wm.WORD_RE.findall(text) if w not in wm.STOPWORDS and not w.isdigit()]
+
+
+def build(branch, records_path, monkeypatch):
+    """Run load_records_and_build through one branch by hiding the libraries before it."""
+    if branch == 'polars':
+        pytest.importorskip('polars')
+        return wm._build_with_polars(records_path)
+    monkeypatch.setitem(sys.modules, 'polars', None)
+    if branch == 'pandas':
+        pytest.importorskip('pandas')
+    else:
+        monkeypatch.setitem(sys.modules, 'pandas', None)
+    return wm.load_records_and_build(records_path)
+
+
+def write_records(path, rows):
+    with path.open('w', encoding='utf-8', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(['id', 'abstract', 'keywords'])
+        writer.writerows((i, abstract, keywords) for i, (abstract, keywords) in enumerate(rows))
+    return path
+
+
+@pytest.mark.parametrize('branch', BRANCHES)
+@pytest.mark.parametrize('text', [
+    'the data-driven state-of-the-art results',
+    "the' their-- data- -data 'the than's",
+    '123 2024 12ab ab12 1-2-3 ٣٤٥',
+    '²³⁴ 2²2 ①②③ x²³ ₁₂₃ ⁴⁵⁶-',
+    'méthode análisis ñandú über_alles',
+    "x²³ --the-- 'ab' a'b'c ١٢٣ ŞTATE;x",
+    '',
+])
+def test_branch_matches_original_filter(tmp_path, monkeypatch, branch, text):
+    path = write_records(tmp_path / 'records.csv', [(text, 'Data;Models')])
+    assert build(branch, path, monkeypatch) == Counter(old_tokens(f'{text} Data;Models'.lower()))
+
+
+@pytest.mark.parametrize('branch', BRANCHES)
+def test_branch_matches_original_filter_fuzz(tmp_path, monkeypatch, branch):
+    alphabet = list("ab-' 1 2 é_²³①٣") + ['the', 'data', 'their', 'than', 'can', '123', '²³⁴']
+    rng = random.Random(0)
+    rows = [(''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 14))), '') for _ in range(20_000)]
+    expected = Counter()
+    for abstract, keywords in rows:
+        expected.update(old_tokens(f'{abstract} {keywords}'.lower()))
+    path = write_records(tmp_path / 'records.csv', rows)
+    assert build(branch, path, monkeypatch) == expected
+
+
+@pytest.mark.parametrize('branch', BRANCHES)
+def test_branch_on_records(monkeypatch, branch):
+    expected = Counter()
+    with RECORDS.open(encoding='utf-8', newline='') as fh:
+        for row in csv.DictReader(fh):
+            expected.update(old_tokens(f"{row['abstract']} {row['keywords']}".lower()))
+    assert build(branch, RECORDS, monkeypatch) == expected
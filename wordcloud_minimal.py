@@ -9,9 +9,10 @@ Usage:
     python wordcloud_minimal.py --data-dir data --out-dir outputs
 
 Behavior:
-- If `data/frequencies.json` exists it will be used.
-- Otherwise the script will read `data/records.csv` and build frequencies
-  from the `abstract` and `keywords` columns.
+- If `data/frequencies.json` exists and is not older than `data/records.csv`
+  it will be used as is.
+- Otherwise the script will read `data/records.csv`, build frequencies
+  from the `abstract` and `keywords` columns and rewrite frequencies.json.
 - It will try to use the `wordcloud` package; if not available it will
   fall back to a Pillow-only renderer that lays out words in rows.
 
@@ -20,6 +21,8 @@ so it can run in constrained environments.
 """
 from __future__ import annotations
 import argparse
+import contextlib
+import functools
 import json
 import os
 import re
@@ -27,6 +30,30 @@ import sys
 from collections import Counter
 from pathlib import Path
 
+# Only the most frequent terms are drawn; the rest would not fit legibly anyway.
+MAX_WORDS = 200
+
+# Keep this small and local to avoid an nltk dependency
+STOPWORDS = frozenset({
+    'the','and','for','with','that','this','from','using','use','research',
+    'study','method','results','analysis','based','data','paper','also',
+    'can','will','these','such','which','our','their','between','than'
+})
+
+WORD_RE = re.compile(r"\b[\w'-]{3,}\b", flags=re.UNICODE)
+
+
+@functools.lru_cache(maxsize=None)
+def _digit_class() -> str:
+    """Regex class of every character str.isdigit() accepts.
+
+    \\d alone misses superscripts, circled digits, etc., which the isdigit()
+    filter drops. None of these characters needs escaping inside a class, and
+    the class is also valid for polars' (Rust) regex engine. Built on first
+    use (~70 ms), so only the polars branch pays for it.
+    """
+    return '[' + ''.join(filter(str.isdigit, map(chr, range(sys.maxunicode + 1)))) + ']'
+
 
 def load_frequencies(freq_path: Path) -> Counter:
     if not freq_path.exists():
@@ -37,110 +64,218 @@ def load_frequencies(freq_path: Path) -> Counter:
     return Counter(terms)
 
 
+def _build_with_polars(records_path: Path) -> Counter:
+    """Count terms with polars (multi-threaded CSV reader, Arrow strings).
+
+    polars' regex engine has no lookarounds, and its \\w / \\b are narrower than
+    Python's (no superscripts or other No-category characters), so WORD_RE
+    cannot be used here. WORD_RE's match is the run of word
+    characters, quotes and hyphens with the outer quotes/hyphens stripped
+    (Python's \\w is exactly [\\p{L}\\p{N}_]). Those tokens are then
+    filtered for length, stopwords and all-digit text as vectorized expressions.
+    """
+    import polars as pl
+    lf = pl.scan_csv(records_path, infer_schema_length=0)
+    names = lf.collect_schema().names()
+    cols = [pl.col(c).fill_null('') if c in names else pl.lit('') for c in ('abstract', 'keywords')]
+    counts = (
+        lf.select(pl.concat_str(cols, separator=' ').str.to_lowercase()
+                  .str.extract_all(r"[\p{L}\p{N}_'-]+").alias('t'))
+        .explode('t')
+        .drop_nulls()
+        .select(pl.col('t').str.strip_chars("'-"))
+        .filter((pl.col('t').str.len_chars() >= 3)
+                & ~pl.col('t').is_in(list(STOPWORDS))
+                & ~pl.col('t').str.contains(f'^{_digit_class()}+$'))
+        .group_by('t')
+        .len()
+        .collect()
+    )
+    return Counter(dict(counts.iter_rows()))
+
+
 def load_records_and_build(records_path: Path) -> Counter:
-    # try pandas first for convenience; fallback to csv module
+    # try polars first, then pandas; fallback to csv module
     if not records_path.exists():
         return Counter()
 
     try:
-        import pandas as pd
-        df = pd.read_csv(records_path, dtype=str).fillna('')
-        texts = (df.get('abstract', pd.Series([''] * len(df))).astype(str).fillna('')
-                 + ' '
-                 + df.get('keywords', pd.Series([''] * len(df))).astype(str).fillna(''))
-        word_re = re.compile(r"\b[\w'-]{3,}\b", flags=re.UNICODE)
+        return _build_with_polars(records_path)
+    except Exception:
+        # polars not installed or could not read the file -> pandas / csv below
+        pass
 
-        STOP = _get_stopwords()
+    try:
+        import pandas as pd
         counter = Counter()
-        for txt in texts:
-            for w in word_re.findall(str(txt).lower()):
-                if w in STOP or w.isdigit():
-                    continue
-                counter[w] += 1
+        # only load the two text columns, a chunk at a time, to keep memory flat
+        chunks = pd.read_csv(records_path, dtype=str, usecols=lambda c: c in ('abstract', 'keywords'),
+                             chunksize=10_000, na_filter=False)
+        for df in chunks:
+            empty = pd.Series([''] * len(df), index=df.index, dtype=str)
+            texts = (df.get('abstract', empty) + ' ' + df.get('keywords', empty)).str.lower()
+            # tokenize, filter and count with vectorized str ops instead of a per-row loop
+            words = texts.str.findall(WORD_RE).explode().dropna()
+            words = words[~words.isin(STOPWORDS) & ~words.str.isdigit()]
+            # cast numpy ints back to int so the counter stays JSON serializable
+            counter.update({w: int(c) for w, c in words.value_counts().items()})
         return counter
     except Exception:
         # Fallback: read CSV with the stdlib csv module if pandas is not available
         import csv
-        word_re = re.compile(r"\b[\w'-]{3,}\b", flags=re.UNICODE)
-        STOP = _get_stopwords()
         counter = Counter()
+        findall = WORD_RE.findall
+        is_stop = STOPWORDS.__contains__
+        update = counter.update
+
+        def count_batch(batch):
+            # one findall + one C-level update per batch instead of per word
+            update(w for w in findall(' '.join(batch).lower()) if not is_stop(w) and not w.isdigit())
+
         try:
             with records_path.open('r', encoding='utf-8', errors='ignore') as fh:
                 reader = csv.DictReader(fh)
+                batch = []
                 for row in reader:
                     abstract = (row.get('abstract') or '')
                     keywords = (row.get('keywords') or row.get('keyword') or '')
-                    txt = f"{abstract} {keywords}"
-                    for w in word_re.findall(txt.lower()):
-                        if w in STOP or w.isdigit():
-                            continue
-                        counter[w] += 1
+                    batch.append(f"{abstract} {keywords}")
+                    if len(batch) >= 1000:
+                        count_batch(batch)
+                        batch = []
+                count_batch(batch)
         except Exception:
             # Any error reading/parsing -> return empty counter
             return Counter()
         return counter
 
 
+def load_bib_entries(text: str) -> list:
+    """Parse BibTeX text into plain entry dicts (with an 'ID' key).
+
+    Works with both the bibtexparser 1.x API (`loads`) and 2.x (`parse_string`).
+    """
+    import bibtexparser
+    if hasattr(bibtexparser, 'loads'):
+        return bibtexparser.loads(text).entries
+    library = bibtexparser.parse_string(text)
+    return [{'ID': e.key, 'ENTRYTYPE': e.entry_type, **{f.key.lower(): f.value for f in e.fields}}
+            for e in library.entries]
+
+
+def _parse_one_bib(bibf: Path) -> list:
+    # module-level so it can be sent to worker processes
+    entries = []
+    try:
+        text = bibf.read_text(encoding='utf-8', errors='ignore')
+        for entry in load_bib_entries(text):
+            eid = entry.get('ID') or entry.get('key') or entry.get('id') or None
+            if not eid:
+                continue
+            title = entry.get('title', '')
+            abstract = entry.get('abstract', '')
+            keywords = entry.get('keywords', '') or entry.get('keyword', '')
+            entries.append({'id': eid, 'title': title, 'abstract': abstract, 'keywords': keywords})
+    except Exception:
+        return []
+    return entries
+
+
+# Below this much .bib text, starting worker processes costs more than parsing
+# serially. Estimate, not a multi-core measurement: bibtexparser 2.x parses
+# 0.06-0.16 s/MiB and a 2-worker spawn pool takes 0.15-0.35 s to start, so
+# two workers only win somewhere past 2-12 MiB.
+PARALLEL_BIB_MIN_BYTES = 8 << 20
+
+
 def parse_bib_files(data_dir: Path) -> list:
     """Parse all .bib files in data_dir and return a list of entry dicts.
 
-    Each dict contains at least: id, title, abstract, keywords
+    Each dict contains at least: id, title, abstract, keywords. bibtexparser is
+    pure Python and CPU-bound, so several large files are parsed in parallel
+    worker processes.
     """
-    bib_entries = []
     try:
         import bibtexparser
     except Exception:
         # bibtexparser not available; cannot parse .bib files
-        return bib_entries
+        return []
 
-    for bibf in data_dir.glob('*.bib'):
+    bib_files = sorted(data_dir.glob('*.bib'))
+    workers = min(len(bib_files), os.cpu_count() or 1)
+    results = None
+    if workers > 1 and sum(f.stat().st_size for f in bib_files) >= PARALLEL_BIB_MIN_BYTES:
         try:
-            text = bibf.read_text(encoding='utf-8', errors='ignore')
-            db = bibtexparser.loads(text)
-            for entry in db.entries:
-                eid = entry.get('ID') or entry.get('key') or entry.get('id') or None
-                if not eid:
-                    continue
-                title = entry.get('title', '')
-                abstract = entry.get('abstract', '')
-                keywords = entry.get('keywords', '') or entry.get('keyword', '')
-                bib_entries.append({'id': eid, 'title': title, 'abstract': abstract, 'keywords': keywords})
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: forking a process that runs server threads is not safe
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as ex:
+                results = list(ex.map(_parse_one_bib, bib_files))
         except Exception:
-            continue
-    return bib_entries
+            results = None
+    if results is None:
+        results = [_parse_one_bib(f) for f in bib_files]
+    return [entry for entries in results for entry in entries]
+
+
+def _merge_with_polars(records_path: Path, new_by_id: dict) -> None:
+    import polars as pl
+    fieldnames = ['id', 'title', 'abstract', 'keywords']
+    if records_path.exists():
+        df = pl.read_csv(records_path, infer_schema_length=0)
+    else:
+        df = pl.DataFrame(schema={k: pl.String for k in fieldnames})
+
+    # empty values become nulls so they are written as bare empty fields, like pandas does
+    new_df = pl.DataFrame(
+        [{'id': str(nid), 'title': rec.get('title') or None, 'abstract': rec.get('abstract') or None,
+          'keywords': rec.get('keywords') or None}
+         for nid, rec in new_by_id.items()],
+        schema={k: pl.String for k in fieldnames})
+    if 'id' in df.columns:
+        new_df = new_df.filter(~pl.col('id').is_in(df['id'].drop_nulls()))
+
+    if new_df.height > 0:
+        pl.concat([df, new_df], how='diagonal').write_csv(records_path)
 
 
 def merge_new_entries_into_records(records_path: Path, new_entries: list) -> None:
     """Merge new_entries (list of dicts) into records.csv, avoiding duplicates by id.
 
-    The function writes records.csv (creates if missing). Uses pandas if available
-    for convenience, otherwise falls back to csv module.
+    The function writes records.csv (creates if missing). Uses polars or pandas if
+    available, otherwise falls back to csv module.
     """
     if not new_entries:
         return
     # normalize new_entries into dict keyed by id
     new_by_id = {e['id']: e for e in new_entries}
 
+    try:
+        _merge_with_polars(records_path, new_by_id)
+        return
+    except Exception:
+        # polars not installed or could not read the file -> pandas / csv below
+        pass
+
     try:
         import pandas as pd
+        fieldnames = ['id', 'title', 'abstract', 'keywords']
         if records_path.exists():
             df = pd.read_csv(records_path, dtype=str).fillna('')
         else:
-            df = pd.DataFrame(columns=['id', 'title', 'abstract', 'keywords'])
-
-        existing_ids = set(df['id'].astype(str).tolist()) if 'id' in df.columns else set()
-        rows = [dict(r) for _, r in df.iterrows()] if not df.empty else []
-
-        added = 0
-        for nid, rec in new_by_id.items():
-            if str(nid) in existing_ids:
-                continue
-            rows.append({'id': nid, 'title': rec.get('title',''), 'abstract': rec.get('abstract',''), 'keywords': rec.get('keywords','')})
-            added += 1
-
-        if added > 0:
-            out_df = pd.DataFrame(rows)
-            out_df.to_csv(records_path, index=False, encoding='utf-8')
+            df = pd.DataFrame(columns=fieldnames)
+
+        new_df = pd.DataFrame.from_records(
+            [{'id': str(nid), 'title': rec.get('title',''), 'abstract': rec.get('abstract',''), 'keywords': rec.get('keywords','')}
+             for nid, rec in new_by_id.items()],
+            columns=fieldnames)
+        # drop incoming ids already present in one vectorized pass, then append
+        if 'id' in df.columns:
+            new_df = new_df[~new_df['id'].isin(df['id'].astype(str))]
+
+        if not new_df.empty:
+            merged = pd.concat([df, new_df], ignore_index=True) if not df.empty else new_df
+            merged.to_csv(records_path, index=False, encoding='utf-8')
         return
     except Exception:
         # fallback to csv module
@@ -169,35 +304,6 @@ def merge_new_entries_into_records(records_path: Path, new_entries: list) -> Non
             for r in rows:
                 writer.writerow({k: r.get(k,'') for k in fieldnames})
         return
-    except Exception:
-        # fallback without pandas
-        import csv
-        word_re = re.compile(r"\b[\w'-]{3,}\b", flags=re.UNICODE)
-        STOP = _get_stopwords()
-        counter = Counter()
-        if not records_path.exists():
-            return counter
-        with records_path.open('r', encoding='utf-8', errors='ignore') as fh:
-            reader = csv.DictReader(fh)
-            for row in reader:
-                abstract = (row.get('abstract') or '')
-                keywords = (row.get('keywords') or row.get('keyword') or '')
-                txt = f"{abstract} {keywords}"
-                for w in word_re.findall(txt.lower()):
-                    if w in STOP or w.isdigit():
-                        continue
-                    counter[w] += 1
-        return counter
-
-
-def _get_stopwords():
-    # Keep this small and local to avoid an nltk dependency
-    base = {
-        'the','and','for','with','that','this','from','using','use','research',
-        'study','method','results','analysis','based','data','paper','also',
-        'can','will','these','such','which','our','their','between','than'
-    }
-    return set(base)
 
 
 def save_frequencies(freq_path: Path, counter: Counter) -> None:
@@ -207,12 +313,47 @@ def save_frequencies(freq_path: Path, counter: Counter) -> None:
         json.dump(payload, f, ensure_ascii=False, indent=2)
 
 
+FONT_CANDIDATES = ['arial.ttf', 'DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 'C:/Windows/Fonts/arial.ttf']
+
+
+@functools.lru_cache(maxsize=None)
+def _font_path():
+    # probe the candidates once per process; bare names are resolved by Pillow's
+    # own font search, so a plain Path.exists() check would miss them
+    from PIL import ImageFont
+    for c in FONT_CANDIDATES:
+        try:
+            ImageFont.truetype(c, 10)
+            return c
+        except Exception:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=256)
+def _load_font(sz):
+    from PIL import ImageFont
+    path = _font_path()
+    return ImageFont.truetype(path, sz) if path else ImageFont.load_default()
+
+
+def _font_height(font, word) -> int:
+    try:
+        ascent, descent = font.getmetrics()
+        return ascent + descent
+    except AttributeError:
+        # bitmap default font (older Pillow) has no getmetrics
+        return font.getbbox(word)[3]
+
+
 def generate_images(counter: Counter, out_png: Path, out_pdf: Path) -> dict:
     # Try to use wordcloud package for nicer rendering
     try:
         from wordcloud import WordCloud
-        wc = WordCloud(width=1400, height=900, background_color='white', collocations=False)
-        wc.generate_from_frequencies(counter)
+        # horizontal-only placement skips the rotate-and-retry path of the layout loop
+        wc = WordCloud(width=1400, height=900, background_color='white', collocations=False,
+                       max_words=MAX_WORDS, prefer_horizontal=1.0, min_font_size=10)
+        wc.generate_from_frequencies(dict(counter.most_common(MAX_WORDS)))
         out_png.parent.mkdir(parents=True, exist_ok=True)
         wc.to_file(str(out_png))
         # try convert to PDF using Pillow
@@ -226,7 +367,7 @@ def generate_images(counter: Counter, out_png: Path, out_pdf: Path) -> dict:
     except Exception:
         # Pillow-only fallback: layout words in rows with sizes proportional to counts
         try:
-            from PIL import Image, ImageDraw, ImageFont
+            from PIL import Image, ImageDraw
         except Exception as e:
             return {'png': None, 'pdf': None, 'error': f'Pillow not available: {e}'}
 
@@ -247,23 +388,15 @@ def generate_images(counter: Counter, out_png: Path, out_pdf: Path) -> dict:
                 return 28
             return int(18 + (v - fmin) / (fmax - fmin) * (120 - 18))
 
-        # font selection - try common fonts
-        def load_font(sz):
-            candidates = ['arial.ttf', 'DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 'C:/Windows/Fonts/arial.ttf']
-            for c in candidates:
-                try:
-                    return ImageFont.truetype(c, sz)
-                except Exception:
-                    continue
-            return ImageFont.load_default()
-
         padding = 8
         x, y = padding, padding
         max_row_h = 0
         for word, cnt in top:
             sz = norm_size(cnt)
-            font = load_font(sz)
-            w, h = draw.textsize(word, font=font)
+            font = _load_font(sz)
+            # getlength/getmetrics measure without rasterizing (textsize is gone in Pillow 10)
+            w = int(font.getlength(word))
+            h = _font_height(font, word)
             if x + w + padding > W:
                 x = padding
                 y += max_row_h + padding
@@ -284,14 +417,37 @@ def generate_images(counter: Counter, out_png: Path, out_pdf: Path) -> dict:
         return {'png': str(out_png), 'pdf': str(out_pdf) if out_pdf.exists() else None, 'method': 'pillow_fallback'}
 
 
-def main(argv=sys.argv[1:]):
-    p = argparse.ArgumentParser()
-    p.add_argument('--data-dir', default='data', help='Directory with records.csv or frequencies.json')
-    p.add_argument('--out-dir', default='outputs', help='Directory to write nube_palabras.png/pdf')
-    args = p.parse_args(argv)
+@contextlib.contextmanager
+def _exclusive_lock(lock_path: Path):
+    """Hold an exclusive flock on lock_path; a no-op where fcntl is unavailable (Windows)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_path.open('w') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
 
-    data_dir = Path(args.data_dir)
-    out_dir = Path(args.out_dir)
+
+def generate(data_dir: Path, out_dir: Path) -> int:
+    """Run the full pipeline (bib merge -> frequencies -> images) and return an exit code.
+
+    Kept separate from `main` so the server can call it in-process. Runs are
+    serialized through a lock file in out_dir, so concurrent server workers
+    never write records.csv or the images at the same time.
+    """
+    data_dir = Path(data_dir)
+    out_dir = Path(out_dir)
+    with _exclusive_lock(out_dir / '.wordcloud.lock'):
+        return _generate(data_dir, out_dir)
+
+
+def _generate(data_dir: Path, out_dir: Path) -> int:
     records_path = data_dir / 'records.csv'
     freq_path = data_dir / 'frequencies.json'
     out_png = out_dir / 'nube_palabras.png'
@@ -307,29 +463,39 @@ def main(argv=sys.argv[1:]):
         # non-fatal
         pass
 
+    # frequencies.json is reused as long as records.csv has not changed after it
+    # was written (e.g. by the bib merge above); only then is the corpus re-tokenized
     counter = Counter()
-    if freq_path.exists():
+    if freq_path.exists() and (not records_path.exists()
+                               or freq_path.stat().st_mtime_ns >= records_path.stat().st_mtime_ns):
         counter = load_frequencies(freq_path)
-        if not counter and records_path.exists():
-            counter = load_records_and_build(records_path)
-    else:
-        if records_path.exists():
-            counter = load_records_and_build(records_path)
+    from_cache = bool(counter)
+    if not counter and records_path.exists():
+        counter = load_records_and_build(records_path)
 
     if not counter:
         print('No terms found. Ensure data/records.csv or data/frequencies.json is present.')
         return 1
 
-    # Update frequencies.json
-    try:
-        save_frequencies(freq_path, counter)
-    except Exception as e:
-        print('Warning: could not write frequencies.json:', e)
+    # Update frequencies.json (already current when it was just loaded)
+    if not from_cache:
+        try:
+            save_frequencies(freq_path, counter)
+        except Exception as e:
+            print('Warning: could not write frequencies.json:', e)
 
     res = generate_images(counter, out_png, out_pdf)
     print('Result:', res)
     return 0
 
 
+def main(argv=sys.argv[1:]):
+    p = argparse.ArgumentParser()
+    p.add_argument('--data-dir', default='data', help='Directory with records.csv or frequencies.json')
+    p.add_argument('--out-dir', default='outputs', help='Directory to write nube_palabras.png/pdf')
+    args = p.parse_args(argv)
+    return generate(Path(args.data_dir), Path(args.out_dir))
+
+
 if __name__ == '__main__':
     raise SystemExit(main())